@@ -62,6 +62,7 @@ class TeraSimToCosmosConverter:
         self.streetview_retrieval = self.config.get("streetview_retrieval", True)
         self.google_model = self.config.get("google_model")
         self.openrouter_model = self.config.get("openrouter_model")
+        self.refresh_cache = self.config.get("refresh_cache", False)
 
         self.path_to_output = self.path_to_output / f"{self.vehicle_id}_{self.time_start:.1f}_{self.time_end:.1f}".replace(".", "_")
 
@@ -71,6 +72,7 @@ class TeraSimToCosmosConverter:
         self.streetview_analyzer = StreetViewRetrievalAndAnalysis(
             google_model=selected_google_model,
             openrouter_model=selected_openrouter_model,
+            refresh_cache=self.refresh_cache,
         )
 
     def _load_vehicle_id_from_monitor(self) -> str:
@@ -1,29 +1,268 @@
+import asyncio
 import base64
-import sumolib
+import contextlib
+import cv2
+import diskcache
+import functools
+import hashlib
+import numpy as np
+import orjson
+import pyproj
 import dotenv
 import os
-import requests
+import httpx
 from pathlib import Path
 import xml.etree.ElementTree as ET
+from typing import NamedTuple
 import importlib
+import json
+import mmap
+import shutil
+import tempfile
 import yaml
 from datetime import datetime
 
 # Load environment variables
 dotenv.load_dotenv()
 
+# Invariant instructions sent ahead of every request. Keep this free of interpolation so it
+# stays a byte-identical prefix that provider-side prompt caches can reuse across calls.
+STATIC_SYSTEM_PROMPT = (
+    "Please describe the environment and setting of each street view image. Focus on static elements like buildings, roads, vegetation, weather conditions, and overall atmosphere. Ignore any moving objects or people. This description will be used as a prompt for video generation. "
+    "Respond only with a JSON object that maps each camera name to its description."
+)
+STREETVIEW_CACHE_DIR = Path(".cache") / "streetview"
+LLM_IMAGE_MAX_EDGE = 768
+LLM_IMAGE_JPEG_QUALITY = 75
+# Prefer the libyaml-backed loader when PyYAML was built with it
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+# Time of day for each hour 0-23
+_HOUR_TO_DESCRIPTOR = (
+    *(["night"] * 5),       # 0-4
+    *(["morning"] * 6),     # 5-10
+    *(["noon"] * 2),        # 11-12
+    *(["afternoon"] * 4),   # 13-16
+    *(["evening"] * 2),     # 17-18
+    *(["night"] * 5),       # 19-23
+)
+
+
+def _compress_for_llm(image_data: bytes | mmap.mmap) -> bytes:
+    """
+    Downscale and re-encode an image to shrink the payload uploaded to the LLM
+
+    Args:
+        image_data: Encoded image data as bytes or a memory-mapped image file
+
+    Returns:
+        JPEG bytes with the long edge capped at LLM_IMAGE_MAX_EDGE, or the original bytes if
+        they cannot be decoded or re-encoding does not make them smaller
+    """
+    image = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return bytes(image_data)
+
+    height, width = image.shape[:2]
+    scale = LLM_IMAGE_MAX_EDGE / max(height, width)
+    if scale < 1.0:
+        image = cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+    ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, LLM_IMAGE_JPEG_QUALITY])
+    if not ok or encoded.nbytes >= len(image_data):
+        return bytes(image_data)
+    return encoded.tobytes()
+
+
+def _is_decodable_image(image_data: bytes) -> bool:
+    """Whether image_data is a non-empty image that OpenCV can decode."""
+    if not image_data:
+        return False
+    return cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), cv2.IMREAD_COLOR) is not None
+
+
+def _iter_track_values(path_to_fcd: str, vehicle_id: str):
+    """Yield time, x, y, angle for every timestep of an FCD file, with NaN positions where the vehicle is absent."""
+    for _, elem in ET.iterparse(path_to_fcd, events=("end",)):
+        if elem.tag != "timestep":
+            continue
+        yield float(elem.get("time"))
+        for vehicle in elem.findall("vehicle"):
+            if vehicle.get("id") == vehicle_id:
+                yield float(vehicle.get("x"))
+                yield float(vehicle.get("y"))
+                yield float(vehicle.get("angle"))
+                break
+        else:
+            yield np.nan
+            yield np.nan
+            yield np.nan
+        elem.clear()
+
+
+class _VehicleTrack(NamedTuple):
+    """Column-oriented track of one vehicle, one entry per FCD timestep sorted by time."""
+    time: np.ndarray
+    x: np.ndarray
+    y: np.ndarray
+    angle: np.ndarray
+
+
+def _track_cache_prefix(path_to_fcd: Path, vehicle_id: str) -> str:
+    """Filename prefix shared by the on-disk track caches of one vehicle in one FCD file."""
+    # SUMO IDs may contain characters such as "/" that are not valid in a filename
+    vehicle_key = hashlib.blake2b(vehicle_id.encode(), digest_size=8).hexdigest()
+    return f".{path_to_fcd.name}.{vehicle_key}."
+
+
+def _track_cache_path(path_to_fcd: Path, mtime_ns: int, vehicle_id: str) -> Path:
+    """Path of the on-disk track cache stored next to the FCD file."""
+    return path_to_fcd.with_name(f"{_track_cache_prefix(path_to_fcd, vehicle_id)}{mtime_ns}.track.npy")
+
+
+def _save_vehicle_track(path_to_fcd: Path, mtime_ns: int, vehicle_id: str, columns: np.ndarray) -> None:
+    """Persist a track next to its FCD file and remove the tracks cached for older versions of it."""
+    cache_path = _track_cache_path(path_to_fcd, mtime_ns, vehicle_id)
+    # Workers converting cases that share an FCD file each write their own temporary file
+    fd, tmp_path = tempfile.mkstemp(prefix=cache_path.name + ".", suffix=".tmp", dir=cache_path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.save(f, columns)
+        os.replace(tmp_path, cache_path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
+
+    prefix = _track_cache_prefix(path_to_fcd, vehicle_id)
+    for sibling in cache_path.parent.iterdir():
+        if sibling != cache_path and sibling.name.startswith(prefix) and sibling.name.endswith(".track.npy"):
+            sibling.unlink(missing_ok=True)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_vehicle_track(path_to_fcd: str, mtime_ns: int, vehicle_id: str) -> _VehicleTrack:
+    """
+    Load the track of a vehicle from an FCD file in a single streaming pass
+
+    The columns are persisted as a (4, T) .npy next to the FCD file, keyed by its mtime, so later
+    runs memory-map it instead of parsing the XML again.
+
+    Args:
+        path_to_fcd: Path to FCD XML file
+        mtime_ns: Modification time of the file, part of both the in-memory and on-disk cache keys
+        vehicle_id: Vehicle ID to track
+
+    Returns:
+        Read-only time, x, y and angle arrays sorted by time, holding one entry per timestep.
+        Position arrays are NaN where the vehicle is absent.
+    """
+    try:
+        columns = np.load(_track_cache_path(Path(path_to_fcd), mtime_ns, vehicle_id), mmap_mode="r")
+    except (OSError, ValueError):
+        rows = np.fromiter(_iter_track_values(path_to_fcd, vehicle_id), dtype=np.float64).reshape(-1, 4)
+        # FCD output is already time-ordered, so only pay for a sort when it is not
+        if np.any(np.diff(rows[:, 0]) < 0):
+            rows = rows[np.argsort(rows[:, 0], kind="stable")]
+        columns = np.ascontiguousarray(rows.T)
+        columns.flags.writeable = False
+        try:
+            _save_vehicle_track(Path(path_to_fcd), mtime_ns, vehicle_id, columns)
+        except (OSError, ValueError):
+            # The FCD directory may be read-only; the in-memory cache still applies
+            pass
+
+    return _VehicleTrack(*columns)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_map_projection(path_to_map: str, mtime_ns: int) -> tuple:
+    """
+    Build the projection of a SUMO network from its <location> element only
+
+    Equivalent to sumolib's convertXY2LonLat without loading edges, lanes and connections.
+
+    Args:
+        path_to_map: Path to SUMO network file
+        mtime_ns: Modification time of the file, only used as part of the cache key
+
+    Returns:
+        Tuple of (transformer from network projection to lon/lat, (netOffset x, netOffset y))
+    """
+    for _, elem in ET.iterparse(path_to_map, events=("start",)):
+        if elem.tag == "location":
+            break
+    else:
+        raise ValueError(f"No location element found in {path_to_map}")
+
+    proj_parameter = elem.get("projParameter", "!")
+    if proj_parameter == "!":
+        raise ValueError(f"SUMO network {path_to_map} has no geo projection")
+    offset_x, offset_y = (float(value) for value in elem.get("netOffset", "0,0").split(","))
+
+    transformer = pyproj.Transformer.from_crs(pyproj.CRS(proj_parameter), "EPSG:4326", always_xy=True)
+    return transformer, (offset_x, offset_y)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_environment_context_from_report(report_path: str, mtime_ns: int) -> tuple[str, str | None]:
+    """
+    Parse environment metadata from a report.yaml file
+
+    Args:
+        report_path: Path to report.yaml
+        mtime_ns: Modification time of the file, only used as part of the cache key
+
+    Returns:
+        Tuple of (environment description, time of day descriptor or None)
+    """
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            report_data = yaml.load(f, Loader=_YAML_LOADER) or {}
+    except (OSError, yaml.YAMLError):
+        return "", None
+
+    accident_weather = report_data.get("accident_weather", {}) or {}
+    weather = accident_weather.get("weather")
+    light = accident_weather.get("light")
+    road_surface = accident_weather.get("road_surface_condition")
+
+    accident_time_str = report_data.get("accident_time")
+    time_descriptor = None
+    if accident_time_str:
+        try:
+            accident_dt = datetime.strptime(accident_time_str, "%m/%d/%Y %H:%M")
+            time_descriptor = _HOUR_TO_DESCRIPTOR[accident_dt.hour]
+        except ValueError:
+            time_descriptor = None
+
+    components = []
+    if weather:
+        components.append(f"weather: {weather}")
+    if light:
+        components.append(f"lighting: {light}")
+    if road_surface:
+        components.append(f"road surface: {road_surface}")
+    if time_descriptor:
+        components.append(f"time of day: {time_descriptor}")
+
+    return ", ".join(components), time_descriptor
+
+
 class StreetViewRetrievalAndAnalysis:
     """
     Class for retrieving and analyzing street view images using Google Street View API and Google Gemini
     """
     
-    def __init__(self, google_model: str | None = None, openrouter_model: str | None = None):
+    def __init__(self, google_model: str | None = None, openrouter_model: str | None = None,
+                 cache_dir: Path | None = None, refresh_cache: bool = False):
         """
         Initialize StreetViewRetrievalAndAnalysis
         
         Args:
             google_maps_api_key: Google Maps API key for street view retrieval
             gemini_api_key: Google Gemini API key for image analysis
+            cache_dir: Directory of the on-disk cache for street view images and LLM responses
+            refresh_cache: Ignore cached entries and overwrite them with fresh responses
         """
         # Load API keys from environment if not provided
         self.google_maps_api_key = os.getenv('GOOGLE_MAPS_API_KEY')
@@ -35,6 +274,14 @@ class StreetViewRetrievalAndAnalysis:
         
         self.use_openrouter = bool(self.openrouter_model_name)
 
+        # Street view images and LLM responses are billable round trips, so persist them across runs
+        self.cache = diskcache.Cache(str(cache_dir or STREETVIEW_CACHE_DIR))
+        self.refresh_cache = refresh_cache
+        # In-flight street view downloads and LLM requests of the current retrieval run,
+        # keyed by their cache keys
+        self._pending_images = {}
+        self._pending_descriptions = {}
+
         self.gemini_client = None
         self.openrouter_api_key = None
         self.openrouter_url = "https://openrouter.ai/api/v1/chat/completions"
@@ -55,56 +302,129 @@ class StreetViewRetrievalAndAnalysis:
                 ) from exc
 
             genai_module.configure(api_key=self.gemini_api_key)
-            self.gemini_client = genai_module.GenerativeModel(self.gemini_model_name)
+            self.gemini_client = self._create_gemini_client(genai_module)
+
+    def _create_gemini_client(self, genai_module):
+        """Create the Gemini model with the static instructions as its system instruction."""
+        # The system instruction is too short for an explicit context cache; Gemini's implicit
+        # prefix caching still applies to it
+        return genai_module.GenerativeModel(
+            self.gemini_model_name,
+            system_instruction=STATIC_SYSTEM_PROMPT,
+        )
     
-    def get_street_view_image(self, latitude: float, longitude: float, heading: int = 0, pitch: int = 0, fov: int = 90) -> bytes:
+    async def get_street_view_image(self, client: httpx.AsyncClient, latitude: float, longitude: float, heading: int = 0, pitch: int = 0, fov: int = 90,
+                                    output_path: Path | None = None) -> bytes | Path:
         """
         Get a street view image from Google Street View API
         
         Args:
+            client: Shared HTTP/2 client used for the request
             latitude: Latitude coordinate
             longitude: Longitude coordinate
             heading: Heading angle in degrees (0-360)
             pitch: Pitch angle in degrees (-90 to 90)
             fov: Field of view in degrees (10-120)
+            output_path: If given, stream the image straight into this file instead of
+                holding it in memory
             
         Returns:
-            Image data as bytes
+            Image data as bytes, or output_path once the image has been written to it
         """
         url = f"https://maps.googleapis.com/maps/api/streetview"
+        # Round the request parameters so that nearby repeated requests share a cache entry
         params = {
             'size': '600x400',  # Image size
-            'location': f'{latitude},{longitude}',
-            'heading': heading,
-            'pitch': pitch,
-            'fov': fov,
-            'key': self.google_maps_api_key
+            'location': f'{latitude:.6f},{longitude:.6f}',
+            'heading': int(round(heading)) % 360,
+            'pitch': int(round(pitch)),
+            'fov': int(round(fov)),
         }
-        
-        response = requests.get(url, params=params)
-        if response.status_code == 200:
-            return response.content
-        else:
-            raise Exception(f"Failed to get street view image: {response.status_code}")
+        cache_key = "image:" + self._hash_cache_key(url.encode(), json.dumps(params, sort_keys=True).encode())
+        cached = self._cache_get(cache_key, read=True)
+        if cached is not None:
+            # Small entries come back as bytes, file-backed entries as an open file handle
+            if isinstance(cached, bytes):
+                if output_path is None:
+                    return cached
+                with open(output_path, 'wb') as f:
+                    f.write(cached)
+                return output_path
+            with cached:
+                if output_path is None:
+                    return cached.read()
+                with open(output_path, 'wb') as f:
+                    shutil.copyfileobj(cached, f)
+            return output_path
+
+        if output_path is None:
+            response = await client.get(url, params={**params, 'key': self.google_maps_api_key})
+            if response.status_code == 200:
+                image_data = response.content
+            else:
+                raise Exception(f"Failed to get street view image: {response.status_code}")
+            # Never cache a broken image, it would be served on every later run
+            if not _is_decodable_image(image_data):
+                raise Exception("Street view response is not a valid image")
+
+            self.cache.set(cache_key, image_data)
+            return image_data
+
+        # Identical requests (same rounded location, heading and fov) share one download
+        pending = self._pending_images.get(cache_key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._stream_street_view_image(client, url, params, cache_key, output_path))
+            self._pending_images[cache_key] = pending
+            return await pending
+
+        source_path = await pending
+        if source_path != output_path:
+            shutil.copyfile(source_path, output_path)
+        return output_path
+
+    async def _stream_street_view_image(self, client: httpx.AsyncClient, url: str, params: dict,
+                                        cache_key: str, output_path: Path) -> Path:
+        """Stream a street view image into output_path and add it to the disk cache."""
+        async with client.stream("GET", url, params={**params, 'key': self.google_maps_api_key}) as response:
+            if response.status_code != 200:
+                raise Exception(f"Failed to get street view image: {response.status_code}")
+            with open(output_path, 'wb') as f:
+                async for chunk in response.aiter_bytes(65536):
+                    f.write(chunk)
+
+        # Never cache a broken image, it would be served on every later run
+        if cv2.imread(str(output_path)) is None:
+            output_path.unlink(missing_ok=True)
+            raise Exception("Street view response is not a valid image")
+        with open(output_path, 'rb') as f:
+            self.cache.set(cache_key, f, read=True)
+        return output_path
     
-    def analyze_image_with_llm(
+    async def analyze_image_with_llm(
         self,
-        image_data: bytes,
+        client: httpx.AsyncClient,
+        images: dict[str, bytes],
         environment_description: str = "",
         time_descriptor: str | None = None,
-    ) -> str:
+    ) -> dict[str, str]:
         """
-        Analyze the image using Google Gemini and generate environment description
+        Analyze all camera images in a single LLM request and generate environment descriptions
         
         Args:
-            image_data: Image data as bytes
+            client: Shared HTTP/2 client used for OpenRouter requests
+            images: Ordered mapping from camera name to image data as bytes or memory-mapped files
             environment_description: Additional textual context describing weather/light conditions
             
         Returns:
-            Environment description as string
+            Mapping from camera name to environment description
         """
+        camera_names = list(images.keys())
+        # Only per-request details go here; the invariant instructions live in STATIC_SYSTEM_PROMPT
+        schema = ", ".join(f'"{camera_name}": "..."' for camera_name in camera_names)
         prompt = (
-            "Please describe the environment and setting of this street view image. Focus on static elements like buildings, roads, vegetation, weather conditions, and overall atmosphere. Ignore any moving objects or people. This description will be used as a prompt for video generation."
+            f"You are given {len(camera_names)} street view images captured at the same location, "
+            f"in this order: {', '.join(camera_names)}. "
+            f"Use the JSON form {{{schema}}}."
         )
         if environment_description:
             prompt += (
@@ -116,21 +436,97 @@ class StreetViewRetrievalAndAnalysis:
                 f" The scene occurs during the {time_descriptor}. Explicitly mention this time of day in the description."
             )
 
-        if self.use_openrouter:
-            return self._generate_with_openrouter(prompt, image_data)
+        model_name = self.openrouter_model_name if self.use_openrouter else self.gemini_model_name
+        cache_key = "llm:" + self._hash_cache_key(
+            model_name.encode(), STATIC_SYSTEM_PROMPT.encode(), prompt.encode(), *images.values()
+        )
+        response_text = self._cache_get(cache_key)
+        if response_text is not None:
+            return self._parse_camera_descriptions(response_text, camera_names)
+
+        # Locations with identical images and conditions share one in-flight request
+        pending = self._pending_descriptions.get(cache_key)
+        if pending is None:
+            pending = asyncio.ensure_future(
+                self._request_camera_descriptions(client, prompt, images, camera_names, cache_key)
+            )
+            self._pending_descriptions[cache_key] = pending
+        response_text = await pending
+        return self._parse_camera_descriptions(response_text, camera_names)
+
+    async def _request_camera_descriptions(self, client: httpx.AsyncClient,
+                                           prompt: str,
+                                           images: dict[str, bytes],
+                                           camera_names: list[str],
+                                           cache_key: str) -> str:
+        """Send the LLM request for the given images and cache the raw response text."""
+        # Both providers bill and upload by image size, so send compact copies. cv2 releases the
+        # GIL, so compress in worker threads without blocking the event loop.
+        llm_images = await asyncio.gather(*[
+            asyncio.to_thread(_compress_for_llm, image_data) for image_data in images.values()
+        ])
 
-        if self.gemini_client is None:
-            raise RuntimeError("Gemini client is not initialized")
+        if self.use_openrouter:
+            response_text = await self._generate_with_openrouter(client, prompt, llm_images)
+        else:
+            if self.gemini_client is None:
+                raise RuntimeError("Gemini client is not initialized")
+
+            # The Gemini SDK is blocking, so run it in the default executor
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(
+                None,
+                functools.partial(
+                    self.gemini_client.generate_content,
+                    [prompt] + [
+                        {
+                            "mime_type": "image/jpeg",
+                            "data": image_data
+                        }
+                        for image_data in llm_images
+                    ],
+                    # Constrain the reply to JSON so one stray sentence cannot lose every camera
+                    generation_config={"response_mime_type": "application/json"},
+                ),
+            )
+            response_text = response.text
 
-        response = self.gemini_client.generate_content([
-            prompt,
-            {
-                "mime_type": "image/jpeg",
-                "data": image_data
-            },
-        ])
+        # Only cache responses that parse, so a malformed answer is retried on the next run
+        self._parse_camera_descriptions(response_text, camera_names)
+        self.cache.set(cache_key, response_text)
+        return response_text
 
-        return response.text
+    def _cache_get(self, cache_key: str, read: bool = False):
+        """Return the cached value for cache_key, or None when missing or refreshing."""
+        if self.refresh_cache:
+            return None
+        return self.cache.get(cache_key, read=read)
+
+    @staticmethod
+    def _hash_cache_key(*parts: bytes) -> str:
+        """Build a content-addressed cache key from the given byte strings."""
+        digest = hashlib.sha256()
+        for part in parts:
+            # Length-prefix each part so that different splits cannot collide
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _parse_camera_descriptions(response_text: str, camera_names: list[str]) -> dict[str, str]:
+        """Parse the JSON object returned by the LLM, tolerating a surrounding markdown code fence."""
+        text = response_text.strip()
+        if text.startswith("```"):
+            text = text.split("\n", 1)[-1]
+            text = text.rsplit("```", 1)[0]
+        data = json.loads(text)
+        if not isinstance(data, dict):
+            raise ValueError(f"Expected a JSON object from the LLM, got {type(data).__name__}")
+        return {
+            camera_name: str(data[camera_name])
+            for camera_name in camera_names
+            if data.get(camera_name)
+        }
     
     def get_vehicle_position_at_time(self, path_to_fcd: Path,
                                      vehicle_id: str,
@@ -146,38 +542,65 @@ class StreetViewRetrievalAndAnalysis:
         Returns:
             Tuple of (x, y, angle) for vehicle position, or None if not found
         """
-        tree = ET.parse(path_to_fcd)
-        root = tree.getroot()
-        all_timesteps = list(root.findall("timestep"))
-        all_timesteps.sort(key=lambda x: float(x.get("time")))
-
-        # Find the closest timestep to target_time
-        target_timestep = None
-        min_diff = float('inf')
-        for timestep in all_timesteps:
-            time_diff = abs(float(timestep.get("time")) - target_time)
-            if time_diff < min_diff:
-                min_diff = time_diff
-                target_timestep = timestep
-
-        if target_timestep is None:
+        x, y, angle = self.get_vehicle_positions_at_times(path_to_fcd, vehicle_id, [target_time])[0]
+        if np.isnan(x):
             return None
+        return (float(x), float(y), float(angle))
 
-        # Find the vehicle in this timestep
-        for vehicle in target_timestep.findall("vehicle"):
-            if vehicle.get("id") == vehicle_id:
-                return (
-                    float(vehicle.get("x")),
-                    float(vehicle.get("y")),
-                    float(vehicle.get("angle"))
-                )
-        return None
+    def get_vehicle_positions_at_times(self, path_to_fcd: Path,
+                                       vehicle_id: str,
+                                       target_times: list[float]) -> np.ndarray:
+        """
+        Get vehicle positions and angles from FCD file at several times at once
+
+        Args:
+            path_to_fcd: Path to FCD XML file
+            vehicle_id: Vehicle ID to track
+            target_times: Target times in seconds
+
+        Returns:
+            Array of shape (len(target_times), 3) with columns (x, y, angle), NaN where the
+            vehicle is not present at the closest timestep
+        """
+        path_to_fcd = Path(path_to_fcd)
+        track = _load_vehicle_track(str(path_to_fcd), path_to_fcd.stat().st_mtime_ns, vehicle_id)
+        target_times = np.asarray(target_times, dtype=np.float64)
+        if len(track.time) == 0:
+            return np.full((len(target_times), 3), np.nan)
+
+        # Find the closest timestep to each target time, preferring the earlier one on ties
+        times = track.time
+        idx = np.searchsorted(times, target_times)
+        upper = np.minimum(idx, len(times) - 1)
+        lower = np.maximum(idx - 1, 0)
+        use_lower = (idx == len(times)) | (
+            (idx > 0) & (target_times - times[lower] <= times[upper] - target_times)
+        )
+        idx = np.where(use_lower, lower, upper)
+        return np.column_stack((track.x[idx], track.y[idx], track.angle[idx]))
+    
+    def convert_xy_to_lonlat(self, path_to_map: Path, x: float, y: float) -> tuple:
+        """
+        Convert SUMO network coordinates to geographic coordinates
+
+        Args:
+            path_to_map: Path to SUMO network file
+            x: X coordinate(s) in the SUMO network, scalar or array
+            y: Y coordinate(s) in the SUMO network, scalar or array
+
+        Returns:
+            Tuple of (lon, lat), with arrays converted in a single call
+        """
+        path_to_map = Path(path_to_map)
+        transformer, (offset_x, offset_y) = _load_map_projection(str(path_to_map), path_to_map.stat().st_mtime_ns)
+        return transformer.transform(x - offset_x, y - offset_y)
     
     def get_streetview_image_and_description(self, path_to_output: Path,
                                              path_to_fcd: Path,
                                              path_to_map: Path,
                                              vehicle_id: str = None,
-                                             target_time: float = 0.0) -> str:
+                                             target_time: float = 0.0,
+                                             target_times: list[float] | None = None) -> str:
         """
         Get street view image and generate environment description at a specific time
 
@@ -187,29 +610,33 @@ class StreetViewRetrievalAndAnalysis:
             path_to_map: Path to SUMO network file
             vehicle_id: Vehicle ID to track
             target_time: Target time in seconds to capture street view
+            target_times: Several target times to capture street view at, overriding target_time.
+                With more than one time, results are written to one subdirectory per time.
 
         Returns:
             Environment description as string
         """
-        # Load SUMO network
-        sumo_net = sumolib.net.readNet(path_to_map)
-
-        # Get vehicle position at target time
-        vehicle_position = self.get_vehicle_position_at_time(
+        if target_times is None:
+            target_times = [target_time]
+        # repr gives the shortest string that round-trips, so distinct times never share a folder
+        time_dir_names = [f"time_{float(time)!r}".replace(".", "_") for time in target_times]
+        if len(set(time_dir_names)) != len(time_dir_names):
+            raise ValueError(f"Duplicate target times: {target_times}")
+
+        # Get vehicle positions at all target times with one track lookup
+        positions = self.get_vehicle_positions_at_times(
             path_to_fcd=path_to_fcd,
             vehicle_id=vehicle_id,
-            target_time=target_time
+            target_times=target_times
         )
-
-        if vehicle_position is None:
+        found = ~np.isnan(positions[:, 0])
+        if not found.any():
             return "Vehicle not found at the specified time"
 
-        x, y, angle = vehicle_position
-        # Convert coordinates to lat/lon
-        lon, lat = sumo_net.convertXY2LonLat(x, y)
-
-        # Get street view image from front view
-        print(f"Processing location at lon: {lon}, lat: {lat}, angle: {angle}")
+        # Convert coordinates of all found positions to lat/lon in one batch
+        lons = np.full(len(target_times), np.nan)
+        lats = np.full(len(target_times), np.nan)
+        lons[found], lats[found] = self.convert_xy_to_lonlat(path_to_map, positions[found, 0], positions[found, 1])
 
         # Get street view images from 6 directions around the vehicle
         camera_angle_list = {'front': 0, "front_left": -66, "front_right": 66, "rear": 180, "rear_left": -152, "rear_right": 152}
@@ -226,111 +653,218 @@ class StreetViewRetrievalAndAnalysis:
         # Load environment metadata from crash report if available
         environment_description, time_descriptor = self._load_environment_context(path_to_fcd)
 
-        descriptions = []
-        for camera_name, camera_angle in camera_angle_list.items():
-            try:
-                heading = angle + camera_angle
-                fov = fov_list[camera_name]
-                image_data = self.get_street_view_image(lat, lon, heading=heading, fov=fov)
-
-                # Save image to file
-                image_filename = f"streetview_image_{camera_name}.jpg"
-                with open(path_to_output / image_filename, 'wb') as f:
-                    f.write(image_data)
-                print(f"Street view image saved as {path_to_output / image_filename}")
-
-                # Generate environment description
-                description = self.analyze_image_with_llm(
-                    image_data,
-                    environment_description=environment_description,
-                    time_descriptor=time_descriptor,
-                )
-                # Add default prompt at the beginning
-                time_prefix = f"The scene occurs during the {time_descriptor}. " if time_descriptor else ""
-                full_description = default_prompt_list[camera_name] + time_prefix + description
-                desc_filename = f"prompt_{camera_name}.txt"
-                with open(path_to_output / desc_filename, 'w') as f:
-                    f.write(full_description)
-                print(f"Environment description saved as {path_to_output / desc_filename}")
-
-                descriptions.append(f"{camera_name}: {full_description}")
-
-            except Exception as e:
-                print(f"Error retrieving street view for {camera_name}: {e}")
-                descriptions.append(f"{camera_name}: Failed to retrieve street view")
+        locations = []
+        for time, time_dir_name, (_, _, angle), lon, lat, is_found in zip(
+            target_times, time_dir_names, positions, lons, lats, found
+        ):
+            if not is_found:
+                print(f"Vehicle not found at time {time}")
+                continue
+            location_output = path_to_output
+            if len(target_times) > 1:
+                location_output = path_to_output / time_dir_name
+                location_output.mkdir(parents=True, exist_ok=True)
+            print(f"Processing location at lon: {lon}, lat: {lat}, angle: {angle}")
+            locations.append((location_output, float(lat), float(lon), float(angle)))
+
+        descriptions = asyncio.run(self._retrieve_all_camera_descriptions(
+            locations=locations,
+            camera_angle_list=camera_angle_list,
+            fov_list=fov_list,
+            default_prompt_list=default_prompt_list,
+            environment_description=environment_description,
+            time_descriptor=time_descriptor,
+        ))
 
         # Combine all descriptions
         combined_description = "\n\n".join(descriptions)
         return combined_description
 
-    def _load_environment_context(self, path_to_fcd: Path) -> tuple[str, str | None]:
-        """Load environment metadata (weather, light, road surface, time of day) from report.yaml."""
-        report_path = path_to_fcd.parent / "report.yaml"
-        if not report_path.exists():
-            return "", None
-
+    async def _retrieve_all_camera_descriptions(self, locations: list[tuple],
+                                                camera_angle_list: dict,
+                                                fov_list: dict,
+                                                default_prompt_list: dict,
+                                                environment_description: str,
+                                                time_descriptor: str | None) -> list[str]:
+        """Retrieve and describe the camera views of every (output dir, lat, lon, angle) location."""
+        # One keep-alive HTTP/2 client multiplexes all requests per host over a single TLS
+        # connection, while the limits keep us under Google's per-IP concurrency limits
+        limits = httpx.Limits(max_connections=12, max_keepalive_connections=12)
         try:
-            with open(report_path, "r", encoding="utf-8") as f:
-                report_data = yaml.safe_load(f) or {}
-        except (OSError, yaml.YAMLError):
-            return "", None
+            async with httpx.AsyncClient(http2=True, limits=limits, timeout=30.0) as client:
+                results = await asyncio.gather(*[
+                    self._retrieve_camera_descriptions(
+                        client,
+                        path_to_output=location_output,
+                        lat=lat,
+                        lon=lon,
+                        angle=angle,
+                        camera_angle_list=camera_angle_list,
+                        fov_list=fov_list,
+                        default_prompt_list=default_prompt_list,
+                        environment_description=environment_description,
+                        time_descriptor=time_descriptor,
+                    )
+                    for location_output, lat, lon, angle in locations
+                ])
+        finally:
+            self._pending_images.clear()
+            self._pending_descriptions.clear()
+        return [description for descriptions in results for description in descriptions]
+
+    async def _retrieve_camera_descriptions(self, client: httpx.AsyncClient,
+                                            path_to_output: Path,
+                                            lat: float,
+                                            lon: float,
+                                            angle: float,
+                                            camera_angle_list: dict,
+                                            fov_list: dict,
+                                            default_prompt_list: dict,
+                                            environment_description: str,
+                                            time_descriptor: str | None) -> list[str]:
+        """Fetch all camera images concurrently, then describe them in a single LLM request."""
+        camera_names = list(camera_angle_list.keys())
+        # Stream each image straight to its file
+        image_paths = await asyncio.gather(
+            *[
+                self.get_street_view_image(
+                    client,
+                    lat,
+                    lon,
+                    heading=angle + camera_angle_list[camera_name],
+                    fov=fov_list[camera_name],
+                    output_path=path_to_output / f"streetview_image_{camera_name}.jpg",
+                )
+                for camera_name in camera_names
+            ],
+            return_exceptions=True,
+        )
 
-        accident_weather = report_data.get("accident_weather", {}) or {}
-        weather = accident_weather.get("weather")
-        light = accident_weather.get("light")
-        road_surface = accident_weather.get("road_surface_condition")
+        llm_results, image_errors, llm_error = await self._describe_saved_images(
+            client,
+            camera_names,
+            image_paths,
+            environment_description=environment_description,
+            time_descriptor=time_descriptor,
+        )
 
-        accident_time_str = report_data.get("accident_time")
-        time_descriptor = None
-        if accident_time_str:
-            try:
-                accident_dt = datetime.strptime(accident_time_str, "%m/%d/%Y %H:%M")
-                hour = accident_dt.hour
-                if 5 <= hour < 11:
-                    time_descriptor = "morning"
-                elif 11 <= hour < 13:
-                    time_descriptor = "noon"
-                elif 13 <= hour < 17:
-                    time_descriptor = "afternoon"
-                elif 17 <= hour < 19:
-                    time_descriptor = "evening"
+        descriptions = []
+        for camera_name in camera_names:
+            description = llm_results.get(camera_name)
+            if description is None:
+                error = image_errors.get(camera_name) or llm_error or "no description returned by the LLM"
+                print(f"Error retrieving street view for {camera_name}: {error}")
+                descriptions.append(f"{camera_name}: Failed to retrieve street view")
+                continue
+
+            # Add default prompt at the beginning
+            time_prefix = f"The scene occurs during the {time_descriptor}. " if time_descriptor else ""
+            full_description = default_prompt_list[camera_name] + time_prefix + description
+            desc_filename = f"prompt_{camera_name}.txt"
+            with open(path_to_output / desc_filename, 'w') as f:
+                f.write(full_description)
+            print(f"Environment description saved as {path_to_output / desc_filename}")
+
+            descriptions.append(f"{camera_name}: {full_description}")
+
+        return descriptions
+
+    async def _describe_saved_images(self, client: httpx.AsyncClient,
+                                     camera_names: list[str],
+                                     image_paths: list,
+                                     environment_description: str,
+                                     time_descriptor: str | None) -> tuple[dict[str, str], dict[str, Exception], Exception | None]:
+        """Describe the saved camera images, returning the descriptions, per-camera image errors and any LLM error."""
+        image_errors = {}
+        with contextlib.ExitStack() as stack:
+            available_images = {}
+            for camera_name, image_path in zip(camera_names, image_paths):
+                if isinstance(image_path, Exception):
+                    image_errors[camera_name] = image_path
+                    continue
+                print(f"Street view image saved as {image_path}")
+                # Map the written file instead of copying it onto the Python heap. Empty or
+                # unreadable files fail like a download would, without affecting other cameras.
+                try:
+                    with open(image_path, 'rb') as f:
+                        available_images[camera_name] = stack.enter_context(
+                            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                        )
+                except (OSError, ValueError) as e:
+                    image_errors[camera_name] = e
+
+            # Cameras snapped to the same panorama can get byte-identical images; describe each once
+            unique_images = {}
+            duplicate_of = {}
+            camera_by_digest = {}
+            for camera_name, image_data in available_images.items():
+                digest = hashlib.blake2b(image_data, digest_size=16).digest()
+                if digest in camera_by_digest:
+                    duplicate_of[camera_name] = camera_by_digest[digest]
                 else:
-                    time_descriptor = "night"
-            except ValueError:
-                time_descriptor = None
-
-        components = []
-        if weather:
-            components.append(f"weather: {weather}")
-        if light:
-            components.append(f"lighting: {light}")
-        if road_surface:
-            components.append(f"road surface: {road_surface}")
-        if time_descriptor:
-            components.append(f"time of day: {time_descriptor}")
+                    camera_by_digest[digest] = camera_name
+                    unique_images[camera_name] = image_data
+
+            llm_results = {}
+            llm_error = None
+            if unique_images:
+                try:
+                    llm_results = await self.analyze_image_with_llm(
+                        client,
+                        unique_images,
+                        environment_description=environment_description,
+                        time_descriptor=time_descriptor,
+                    )
+                except Exception as e:
+                    llm_error = e
+
+        for camera_name, source_camera_name in duplicate_of.items():
+            if source_camera_name in llm_results:
+                llm_results[camera_name] = llm_results[source_camera_name]
+
+        return llm_results, image_errors, llm_error
 
-        return ", ".join(components), time_descriptor
+    def _load_environment_context(self, path_to_fcd: Path) -> tuple[str, str | None]:
+        """Load environment metadata (weather, light, road surface, time of day) from report.yaml."""
+        report_path = path_to_fcd.parent / "report.yaml"
+        try:
+            mtime_ns = report_path.stat().st_mtime_ns
+        except OSError:
+            return "", None
+        return _load_environment_context_from_report(str(report_path), mtime_ns)
 
-    def _generate_with_openrouter(self, prompt: str, image_data: bytes) -> str:
-        image_b64 = base64.b64encode(image_data).decode('utf-8')
-        content = [
-            {"type": "text", "text": prompt},
-            {
+    async def _generate_with_openrouter(self, client: httpx.AsyncClient, prompt: str, images: list[bytes]) -> str:
+        content = [{"type": "text", "text": prompt}]
+        for image_data in images:
+            image_b64 = base64.b64encode(image_data).decode('utf-8')
+            content.append({
                 "type": "image_url",
                 "image_url": {
                     "url": f"data:image/jpeg;base64,{image_b64}"
                 }
-            },
-        ]
+            })
 
         payload = {
             "model": self.openrouter_model_name,
             "messages": [
+                {
+                    "role": "system",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": STATIC_SYSTEM_PROMPT,
+                            # Honoured by Anthropic-backed models; others cache the prefix implicitly
+                            "cache_control": {"type": "ephemeral"},
+                        }
+                    ]
+                },
                 {
                     "role": "user",
                     "content": content
                 }
-            ]
+            ],
+            # All cameras share one reply, so make the provider enforce JSON output
+            "response_format": {"type": "json_object"},
         }
 
         headers = {
@@ -338,7 +872,8 @@ class StreetViewRetrievalAndAnalysis:
             "Content-Type": "application/json"
         }
 
-        response = requests.post(self.openrouter_url, headers=headers, json=payload, timeout=60)
+        # The payload carries base64 images, so serialize it with orjson rather than json.dumps
+        response = await client.post(self.openrouter_url, headers=headers, content=orjson.dumps(payload), timeout=60)
         response.raise_for_status()
-        data = response.json()
+        data = orjson.loads(response.content)
         return data["choices"][0]["message"]["content"]
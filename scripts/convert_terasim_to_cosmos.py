@@ -1,10 +1,39 @@
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+import multiprocessing
 from pathlib import Path
 import sys
+import traceback
 import argparse
 
 from terasim_cosmos import TeraSimToCosmosConverter
 
 
+def _process_one_case(case_dir: Path, base_config: dict) -> tuple[str, bool, str]:
+    """Convert a single case directory laid out as <case>/final.fcd.xml and <case>/map.net.xml."""
+    path_to_fcd = case_dir / "final.fcd.xml"
+    path_to_map = case_dir / "map.net.xml"
+    if not path_to_fcd.is_file():
+        return case_dir.name, False, f"missing {path_to_fcd.name}"
+    if not path_to_map.is_file():
+        return case_dir.name, False, f"missing {path_to_map.name}"
+
+    config_dict = {
+        **base_config,
+        "path_to_output": str(case_dir / "hdvideo"),
+        "path_to_fcd": str(path_to_fcd),
+        "path_to_map": str(path_to_map),
+    }
+    try:
+        # Build the converter inside the worker so API clients are never pickled
+        converter = TeraSimToCosmosConverter.from_config_dict(config_dict)
+        converter.convert()
+    except Exception:
+        # Keep the full traceback, the worker's stack is lost once it returns
+        return case_dir.name, False, traceback.format_exc()
+    return case_dir.name, True, ""
+
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
         description="Convert TeraSim simulation data to Cosmos-Drive compatible format"
@@ -43,6 +72,16 @@ if __name__ == "__main__":
     parser.add_argument("--no_streetview_retrieval", dest="streetview_retrieval", action="store_false",
                         help="Disable street view retrieval")
     parser.set_defaults(streetview_retrieval=True)
+    parser.add_argument("--refresh_cache", action="store_true",
+                        help="Bypass cached street view images and descriptions and fetch them again")
+
+    # Batch processing
+    parser.add_argument("--cases_dir", type=Path,
+                        help="Convert every case subdirectory (containing final.fcd.xml and map.net.xml) "
+                             "of this directory instead of a single FCD/map pair; output goes to <case>/hdvideo")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes used with --cases_dir; each runs the full "
+                             "rendering pipeline, so keep this small (default: %(default)s)")
 
     args = parser.parse_args()
 
@@ -60,8 +99,23 @@ if __name__ == "__main__":
         "streetview_retrieval": args.streetview_retrieval,
         "google_model": args.google_model,
         "openrouter_model": args.openrouter_model,
+        "refresh_cache": args.refresh_cache,
     }
 
+    if args.cases_dir is not None:
+        case_dirs = sorted(path for path in args.cases_dir.iterdir() if path.is_dir())
+        failed = []
+        # Spawn fresh workers, forking after tensorflow/torch/ray have started threads can hang
+        with ProcessPoolExecutor(max_workers=args.jobs, mp_context=multiprocessing.get_context("spawn")) as executor:
+            for case_name, success, note in executor.map(partial(_process_one_case, base_config=config_dict), case_dirs):
+                if success:
+                    print(f"[INFO] {case_name}: success")
+                else:
+                    print(f"[ERROR] {case_name}: {note}", file=sys.stderr)
+                    failed.append(case_name)
+        print(f"Converted {len(case_dirs) - len(failed)}/{len(case_dirs)} cases")
+        sys.exit(1 if failed else 0)
+
     # Create converter and run conversion
     converter = TeraSimToCosmosConverter.from_config_dict(config_dict)
     converter.convert()
\ No newline at end of file
@@ -0,0 +1,6 @@
+"""
+TeraSim-Cosmos conversion tests
+
+Tests for the street view retrieval and analysis helpers used when
+converting TeraSim simulations into Cosmos-Drive inputs.
+"""
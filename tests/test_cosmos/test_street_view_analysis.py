@@ -0,0 +1,464 @@
+import asyncio
+import json
+import os
+
+import cv2
+import httpx
+import numpy as np
+import pytest
+from terasim_cosmos import street_view_analysis
+from terasim_cosmos.street_view_analysis import (
+    _HOUR_TO_DESCRIPTOR,
+    StreetViewRetrievalAndAnalysis,
+)
+
+FCD_XML = """<fcd-export>
+    <timestep time="0.00">
+        <vehicle id="ego" x="10.0" y="20.0" angle="0.0"/>
+        <vehicle id="other" x="0.0" y="0.0" angle="0.0"/>
+    </timestep>
+    <timestep time="0.50">
+        <vehicle id="ego" x="11.0" y="21.0" angle="5.0"/>
+    </timestep>
+    <timestep time="1.00">
+        <vehicle id="ego" x="12.0" y="22.0" angle="10.0"/>
+    </timestep>
+    <timestep time="1.50">
+        <vehicle id="other" x="1.0" y="1.0" angle="0.0"/>
+    </timestep>
+</fcd-export>
+"""
+
+# A network reduced to its <location> element, offset like a net converted from OSM
+OFFSET_NET_XML = """<net version="1.16">
+    <location netOffset="-277500.00,-4686700.00" convBoundary="0.00,0.00,1000.00,1000.00"
+              origBoundary="-83.70,42.29,-83.69,42.31"
+              projParameter="+proj=utm +zone=17 +ellps=WGS84 +datum=WGS84 +units=m +no_defs"/>
+</net>
+"""
+
+CAMERA_NAMES = ["front", "front_left", "front_right", "rear", "rear_left", "rear_right"]
+
+
+class FakeStreetViewServer:
+    """Serve street view images and OpenRouter replies while counting the requests."""
+
+    def __init__(self):
+        self.image_requests = 0
+        self.llm_requests = 0
+        self.image_size = (400, 600)
+        self.noisy_images = False
+        self.same_image_headings = set()
+        self.image_override = None
+        self.described_cameras = []
+
+    def make_image(self, heading: int) -> bytes:
+        """Encode an image that differs per heading."""
+        if self.noisy_images:
+            # Noise does not compress, which pushes the image past diskcache's inline size
+            image = np.random.default_rng(heading).integers(0, 256, (*self.image_size, 3))
+            image = image.astype(np.uint8)
+        else:
+            image = np.full((*self.image_size, 3), heading % 256, dtype=np.uint8)
+        return cv2.imencode(".jpg", image)[1].tobytes()
+
+    def handle(self, request: httpx.Request) -> httpx.Response:
+        if "streetview" in request.url.path:
+            self.image_requests += 1
+            if self.image_override is not None:
+                return httpx.Response(200, content=self.image_override)
+            heading = int(request.url.params["heading"])
+            if heading in self.same_image_headings:
+                heading = 0
+            return httpx.Response(200, content=self.make_image(heading))
+
+        self.llm_requests += 1
+        user_content = json.loads(request.content)["messages"][1]["content"]
+        prompt = user_content[0]["text"]
+        camera_names = prompt.split("in this order: ")[1].split(". ")[0].split(", ")
+        assert len(user_content) - 1 == len(camera_names)
+        self.described_cameras.extend(camera_names)
+        reply = json.dumps({name: f"{name} description" for name in camera_names})
+        return httpx.Response(200, json={"choices": [{"message": {"content": reply}}]})
+
+
+@pytest.fixture
+def analyzer(temp_dir, monkeypatch):
+    """Provide an analyzer configured for OpenRouter so no Gemini client is created."""
+    monkeypatch.setenv("GOOGLE_MAPS_API_KEY", "test-maps-key")
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test-openrouter-key")
+    return StreetViewRetrievalAndAnalysis(
+        openrouter_model="test/model", cache_dir=temp_dir / "cache"
+    )
+
+
+@pytest.fixture
+def street_view_server(monkeypatch):
+    """Route every HTTP client the analyzer creates to a FakeStreetViewServer."""
+    server = FakeStreetViewServer()
+    real_client = httpx.AsyncClient
+
+    def client_factory(*args, **kwargs):
+        return real_client(*args, transport=httpx.MockTransport(server.handle), **kwargs)
+
+    monkeypatch.setattr(httpx, "AsyncClient", client_factory)
+    return server
+
+
+@pytest.fixture
+def fcd_path(temp_dir):
+    """Provide an FCD file where the ego vehicle leaves before the last timestep."""
+    path = temp_dir / "final.fcd.xml"
+    path.write_text(FCD_XML)
+    return path
+
+
+@pytest.mark.parametrize("target_time, expected", [
+    (0.0, (10.0, 20.0, 0.0)),
+    (0.1, (10.0, 20.0, 0.0)),
+    (0.4, (11.0, 21.0, 5.0)),
+    (0.9, (12.0, 22.0, 10.0)),
+    (-3.0, (10.0, 20.0, 0.0)),
+])
+def test_position_uses_closest_timestep(analyzer, fcd_path, target_time, expected):
+    """The target time resolves to the nearest FCD timestep."""
+    assert analyzer.get_vehicle_position_at_time(fcd_path, "ego", target_time) == expected
+
+
+@pytest.mark.parametrize("target_time, expected", [
+    (0.25, (10.0, 20.0, 0.0)),
+    (0.75, (11.0, 21.0, 5.0)),
+])
+def test_position_prefers_earlier_timestep_on_tie(analyzer, fcd_path, target_time, expected):
+    """A target time halfway between two timesteps resolves to the earlier one."""
+    assert analyzer.get_vehicle_position_at_time(fcd_path, "ego", target_time) == expected
+
+
+@pytest.mark.parametrize("vehicle_id, target_time", [
+    ("ego", 1.5),
+    ("ego", 100.0),
+    ("missing", 0.0),
+])
+def test_position_is_none_where_vehicle_is_absent(analyzer, fcd_path, vehicle_id, target_time):
+    """The vehicle is not carried over from an earlier timestep when absent from the closest."""
+    assert analyzer.get_vehicle_position_at_time(fcd_path, vehicle_id, target_time) is None
+
+
+def test_track_is_reparsed_when_fcd_changes(analyzer, fcd_path):
+    """A rewritten FCD file is not served from the cached track of its previous contents."""
+    assert analyzer.get_vehicle_position_at_time(fcd_path, "ego", 0.0) == (10.0, 20.0, 0.0)
+
+    fcd_path.write_text(FCD_XML.replace('x="10.0" y="20.0"', 'x="30.0" y="40.0"'))
+    mtime_ns = fcd_path.stat().st_mtime_ns + 1_000_000_000
+    os.utime(fcd_path, ns=(mtime_ns, mtime_ns))
+
+    assert analyzer.get_vehicle_position_at_time(fcd_path, "ego", 0.0) == (30.0, 40.0, 0.0)
+
+
+def test_positions_at_times_match_single_lookups(analyzer, fcd_path):
+    """The batched lookup resolves every target time like the single-time lookup."""
+    target_times = [0.0, 0.25, 0.4, 0.75, 0.9, 1.5, -3.0, 100.0]
+
+    positions = analyzer.get_vehicle_positions_at_times(fcd_path, "ego", target_times)
+
+    assert positions.shape == (len(target_times), 3)
+    for target_time, position in zip(target_times, positions):
+        expected = analyzer.get_vehicle_position_at_time(fcd_path, "ego", target_time)
+        if expected is None:
+            assert np.isnan(position).all()
+        else:
+            np.testing.assert_array_equal(position, expected)
+
+
+def test_positions_at_times_of_absent_vehicle_are_nan(analyzer, fcd_path):
+    """A vehicle missing from the FCD yields NaN for every target time."""
+    positions = analyzer.get_vehicle_positions_at_times(fcd_path, "missing", [0.0, 0.5])
+
+    assert np.isnan(positions).all()
+
+
+def test_duplicate_target_times_are_rejected(analyzer, fcd_path, mcity_map_path, temp_dir):
+    """Repeated target times would share an output folder, so they fail before any request."""
+    with pytest.raises(ValueError):
+        analyzer.get_streetview_image_and_description(
+            temp_dir, fcd_path, mcity_map_path / "mcity.net.xml", "ego", target_times=[0.5, 0.5]
+        )
+
+def _track_cache_files(fcd_path):
+    return sorted(path.name for path in fcd_path.parent.glob(f".{fcd_path.name}.*"))
+
+
+def test_track_cache_is_reused_without_parsing(analyzer, fcd_path, monkeypatch):
+    """A track persisted next to the FCD file is loaded without parsing the XML again."""
+    analyzer.get_vehicle_position_at_time(fcd_path, "ego", 0.0)
+    street_view_analysis._load_vehicle_track.cache_clear()
+
+    def fail_parse(*args):
+        raise AssertionError("FCD file parsed again")
+
+    monkeypatch.setattr(street_view_analysis, "_iter_track_values", fail_parse)
+
+    assert analyzer.get_vehicle_position_at_time(fcd_path, "ego", 0.5) == (11.0, 21.0, 5.0)
+
+
+def test_track_cache_supports_vehicle_ids_with_slashes(analyzer, fcd_path):
+    """Vehicle IDs are not used verbatim in the cache filename."""
+    fcd_path.write_text(FCD_XML.replace('id="ego"', 'id="flow/ego.0"'))
+
+    assert analyzer.get_vehicle_position_at_time(fcd_path, "flow/ego.0", 1.0) == (12.0, 22.0, 10.0)
+    assert len(_track_cache_files(fcd_path)) == 1
+
+
+def test_track_cache_replaces_stale_tracks(analyzer, fcd_path):
+    """Only the track of the current FCD version is kept, and no temporary files remain."""
+    analyzer.get_vehicle_position_at_time(fcd_path, "ego", 0.0)
+    analyzer.get_vehicle_position_at_time(fcd_path, "other", 0.0)
+    first_files = _track_cache_files(fcd_path)
+    assert len(first_files) == 2
+
+    mtime_ns = fcd_path.stat().st_mtime_ns + 1_000_000_000
+    os.utime(fcd_path, ns=(mtime_ns, mtime_ns))
+    analyzer.get_vehicle_position_at_time(fcd_path, "ego", 0.0)
+
+    files = _track_cache_files(fcd_path)
+    assert len(files) == 2
+    assert all(name.endswith(".track.npy") for name in files)
+    assert sum(str(mtime_ns) in name for name in files) == 1
+    # The other vehicle's track is left for its own next lookup
+    assert len(set(files) & set(first_files)) == 1
+
+@pytest.mark.parametrize("hour, descriptor", [
+    *((hour, "night") for hour in range(0, 5)),
+    *((hour, "morning") for hour in range(5, 11)),
+    *((hour, "noon") for hour in range(11, 13)),
+    *((hour, "afternoon") for hour in range(13, 17)),
+    *((hour, "evening") for hour in range(17, 19)),
+    *((hour, "night") for hour in range(19, 24)),
+])
+def test_hour_to_descriptor(hour, descriptor):
+    """Every hour of the day maps to its time of day descriptor."""
+    assert len(_HOUR_TO_DESCRIPTOR) == 24
+    assert _HOUR_TO_DESCRIPTOR[hour] == descriptor
+
+
+def test_environment_context_uses_accident_hour(analyzer, fcd_path):
+    """The time of day in report.yaml is derived from the accident hour."""
+    (fcd_path.parent / "report.yaml").write_text(
+        "accident_time: 10/10/2020 18:45\naccident_weather: {weather: rain}\n"
+    )
+
+    environment_description, time_descriptor = analyzer._load_environment_context(fcd_path)
+
+    assert time_descriptor == "evening"
+    assert environment_description == "weather: rain, time of day: evening"
+
+def test_parse_camera_descriptions():
+    """Descriptions are returned in camera order, skipping cameras without a description."""
+    response_text = json.dumps(
+        {"rear": "A rear view", "front": "A front view", "front_left": "", "extra": "x"}
+    )
+
+    descriptions = StreetViewRetrievalAndAnalysis._parse_camera_descriptions(
+        response_text, ["front", "front_left", "rear", "rear_left"]
+    )
+
+    assert descriptions == {"front": "A front view", "rear": "A rear view"}
+    assert list(descriptions) == ["front", "rear"]
+
+
+def test_parse_camera_descriptions_strips_code_fence():
+    """A markdown code fence around the JSON object is ignored."""
+    response_text = '```json\n{"front": "A front view"}\n```'
+
+    descriptions = StreetViewRetrievalAndAnalysis._parse_camera_descriptions(
+        response_text, ["front"]
+    )
+
+    assert descriptions == {"front": "A front view"}
+
+
+@pytest.mark.parametrize("response_text", ['["A front view"]', "The front camera shows a road."])
+def test_parse_camera_descriptions_rejects_non_object(response_text):
+    """Replies that are not a JSON object raise so that they are neither used nor cached."""
+    with pytest.raises(ValueError):
+        StreetViewRetrievalAndAnalysis._parse_camera_descriptions(response_text, ["front"])
+
+
+@pytest.fixture(params=["mcity", "offset"])
+def net_path(request, mcity_map_path, temp_dir):
+    """Provide the Mcity network, which has no offset, and a network with a non-zero offset."""
+    if request.param == "mcity":
+        return mcity_map_path / "mcity.net.xml"
+    path = temp_dir / "offset.net.xml"
+    path.write_text(OFFSET_NET_XML)
+    return path
+
+
+def test_map_projection_matches_full_network_conversion(analyzer, net_path):
+    """Converting with the <location> element alone matches sumolib's network conversion."""
+    sumolib = pytest.importorskip("sumolib")
+    net = sumolib.net.readNet(str(net_path))
+    xs = np.array([0.0, 150.5, 812.25])
+    ys = np.array([0.0, 300.75, 47.0])
+
+    lons, lats = analyzer.convert_xy_to_lonlat(net_path, xs, ys)
+
+    for x, y, lon, lat in zip(xs, ys, lons, lats):
+        expected_lon, expected_lat = net.convertXY2LonLat(x, y)
+        assert lon == pytest.approx(expected_lon, abs=1e-9)
+        assert lat == pytest.approx(expected_lat, abs=1e-9)
+
+
+def test_map_projection_requires_geo_reference(analyzer, temp_dir):
+    """Networks without a projection cannot be converted to lon/lat."""
+    net_path = temp_dir / "plain.net.xml"
+    net_path.write_text('<net><location netOffset="0.00,0.00" projParameter="!"/></net>')
+
+    with pytest.raises(ValueError):
+        analyzer.convert_xy_to_lonlat(net_path, 0.0, 0.0)
+
+
+def _retrieve(analyzer, output_dir, fcd_path, mcity_map_path, **kwargs):
+    output_dir.mkdir(parents=True, exist_ok=True)
+    return analyzer.get_streetview_image_and_description(
+        output_dir, fcd_path, mcity_map_path / "mcity.net.xml", "ego", **kwargs
+    )
+
+
+@pytest.mark.parametrize("noisy_images", [False, True], ids=["inline", "file-backed"])
+def test_second_run_is_served_from_cache(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir, noisy_images
+):
+    """Cached images, whether stored inline or as files, and descriptions skip all requests."""
+    street_view_server.noisy_images = noisy_images
+    _retrieve(analyzer, temp_dir / "first", fcd_path, mcity_map_path)
+    assert (street_view_server.image_requests, street_view_server.llm_requests) == (6, 1)
+
+    _retrieve(analyzer, temp_dir / "second", fcd_path, mcity_map_path)
+
+    assert (street_view_server.image_requests, street_view_server.llm_requests) == (6, 1)
+    for camera_name in CAMERA_NAMES:
+        image_name = f"streetview_image_{camera_name}.jpg"
+        first_image = (temp_dir / "first" / image_name).read_bytes()
+        assert (temp_dir / "second" / image_name).read_bytes() == first_image
+        assert (temp_dir / "second" / f"prompt_{camera_name}.txt").read_text().endswith(
+            f"{camera_name} description"
+        )
+
+
+@pytest.mark.parametrize("noisy_images", [False, True], ids=["inline", "file-backed"])
+def test_cached_image_bytes_match_download(analyzer, street_view_server, noisy_images):
+    """Images requested as bytes come back identical from the network and from the cache."""
+    street_view_server.noisy_images = noisy_images
+
+    async def fetch():
+        async with httpx.AsyncClient() as client:
+            return await analyzer.get_street_view_image(client, 42.3, -83.7, heading=90)
+
+    downloaded = asyncio.run(fetch())
+    cached = asyncio.run(fetch())
+
+    assert downloaded == cached == street_view_server.make_image(90)
+    assert street_view_server.image_requests == 1
+
+
+def test_refresh_cache_fetches_again(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir
+):
+    """With refresh_cache set, cached entries are ignored."""
+    _retrieve(analyzer, temp_dir / "first", fcd_path, mcity_map_path)
+    analyzer.refresh_cache = True
+
+    _retrieve(analyzer, temp_dir / "second", fcd_path, mcity_map_path)
+
+    assert (street_view_server.image_requests, street_view_server.llm_requests) == (12, 2)
+
+
+@pytest.mark.parametrize("body", [b"", b"not an image"], ids=["empty", "garbage"])
+def test_invalid_image_is_not_cached(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir, body
+):
+    """A 200 response that is not an image fails its camera and is fetched again next run."""
+    street_view_server.image_override = body
+    description = _retrieve(analyzer, temp_dir / "first", fcd_path, mcity_map_path)
+    assert description.count("Failed to retrieve street view") == 6
+    assert street_view_server.llm_requests == 0
+
+    street_view_server.image_override = None
+    description = _retrieve(analyzer, temp_dir / "second", fcd_path, mcity_map_path)
+
+    assert "Failed to retrieve street view" not in description
+    assert (street_view_server.image_requests, street_view_server.llm_requests) == (12, 1)
+
+
+def test_identical_images_are_described_once(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir
+):
+    """A camera whose image matches another camera's reuses that camera's description."""
+    # The vehicle faces north, so front_right (66 degrees) gets the same image as front
+    street_view_server.same_image_headings = {66}
+
+    _retrieve(analyzer, temp_dir, fcd_path, mcity_map_path)
+
+    assert street_view_server.llm_requests == 1
+    assert "front_right" not in street_view_server.described_cameras
+    assert len(street_view_server.described_cameras) == 5
+    assert (temp_dir / "prompt_front_right.txt").read_text().endswith("front description")
+
+
+def test_unmappable_image_fails_only_its_camera(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir, monkeypatch
+):
+    """An image file that cannot be memory-mapped is reported for its camera alone."""
+    get_street_view_image = analyzer.get_street_view_image
+
+    async def truncate_rear_image(*args, output_path=None, **kwargs):
+        result = await get_street_view_image(*args, output_path=output_path, **kwargs)
+        if output_path.name == "streetview_image_rear.jpg":
+            output_path.write_bytes(b"")
+        return result
+
+    monkeypatch.setattr(analyzer, "get_street_view_image", truncate_rear_image)
+
+    description = _retrieve(analyzer, temp_dir, fcd_path, mcity_map_path)
+
+    assert "rear: Failed to retrieve street view" in description
+    assert description.count("Failed to retrieve street view") == 1
+    assert not (temp_dir / "prompt_rear.txt").exists()
+    assert street_view_server.described_cameras == [
+        name for name in CAMERA_NAMES if name != "rear"
+    ]
+
+
+def test_identical_locations_share_requests(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir
+):
+    """Target times resolving to the same timestep share their downloads and LLM request."""
+    _retrieve(analyzer, temp_dir / "first", fcd_path, mcity_map_path, target_times=[0.0, 0.1])
+
+    assert (street_view_server.image_requests, street_view_server.llm_requests) == (6, 1)
+    assert analyzer._pending_images == {}
+    assert analyzer._pending_descriptions == {}
+    for camera_name in CAMERA_NAMES:
+        for file_name in (f"streetview_image_{camera_name}.jpg", f"prompt_{camera_name}.txt"):
+            first_time = (temp_dir / "first" / "time_0_0" / file_name).read_bytes()
+            assert (temp_dir / "first" / "time_0_1" / file_name).read_bytes() == first_time
+
+    _retrieve(analyzer, temp_dir / "second", fcd_path, mcity_map_path, target_times=[0.0, 0.1])
+
+    assert (street_view_server.image_requests, street_view_server.llm_requests) == (6, 1)
+    assert sorted(path.name for path in (temp_dir / "second").iterdir()) == ["time_0_0", "time_0_1"]
+
+
+def test_distinct_locations_do_not_share_requests(
+    analyzer, street_view_server, fcd_path, mcity_map_path, temp_dir
+):
+    """Target times resolving to different positions each get their own requests."""
+    output_dir = temp_dir / "out"
+    description = _retrieve(
+        analyzer, output_dir, fcd_path, mcity_map_path, target_times=[0.05, 0.5]
+    )
+
+    assert "Failed to retrieve street view" not in description
+    assert street_view_server.image_requests == 12
+    assert sorted(path.name for path in output_dir.iterdir()) == ["time_0_05", "time_0_5"]
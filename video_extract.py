@@ -1,27 +1,84 @@
 import cv2
 import os
+from collections import deque
+import shutil
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 def extract_frames(video_path, output_dir, interval=0.1):
-    cap = cv2.VideoCapture(video_path)
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    frame_interval = max(1, int(fps * interval))
-    
     os.makedirs(output_dir, exist_ok=True)
+
+    # Let ffmpeg sample and encode inside libav when it is available
+    ffmpeg_path = shutil.which("ffmpeg")
+    if ffmpeg_path is not None:
+        try:
+            _extract_frames_ffmpeg(ffmpeg_path, video_path, output_dir, interval)
+            return
+        except subprocess.CalledProcessError as e:
+            # e.g. an unsupported codec or hardware decoder
+            print(f"ffmpeg frame extraction failed ({e}), falling back to OpenCV")
+    _extract_frames_opencv(video_path, output_dir, interval)
+
+def _frame_interval(fps, interval):
+    # Both extraction paths keep every n-th frame so that they write the same frames
+    return max(1, int(fps * interval))
+
+def _extract_frames_ffmpeg(ffmpeg_path, video_path, output_dir, interval):
+    cap = cv2.VideoCapture(video_path)
+    frame_interval = _frame_interval(cap.get(cv2.CAP_PROP_FPS), interval)
+    cap.release()
+
+    subprocess.run(
+        [
+            ffmpeg_path, "-nostdin", "-hide_banner", "-loglevel", "error",
+            "-hwaccel", "auto",
+            "-i", video_path,
+            "-vf", f"select=not(mod(n\\,{frame_interval}))",
+            "-vsync", "vfr",
+            "-start_number", "0",
+            os.path.join(output_dir, "frame_%06d.png"),
+        ],
+        check=True,
+    )
+
+def _extract_frames_opencv(video_path, output_dir, interval):
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG, [
+        cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY,
+    ])
+    frame_interval = _frame_interval(cap.get(cv2.CAP_PROP_FPS), interval)
     
     frame_count = 0
     saved_count = 0
     
-    while cap.read()[0]:
-        if frame_count % frame_interval == 0:
-            cap.set(cv2.CAP_PROP_POS_FRAMES, frame_count)
-            ret, frame = cap.read()
-            output_path = os.path.join(output_dir, f"frame_{saved_count:06d}.png")
-            cv2.imwrite(output_path, frame)
-            saved_count += 1
-        frame_count += 1
+    # PNG encoding releases the GIL, so overlap it with decoding. Low DEFLATE effort keeps
+    # frames lossless while encoding several times faster than the default level.
+    write_params = [cv2.IMWRITE_PNG_COMPRESSION, 1]
+    max_workers = os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        writes = deque()
+        # grab() only advances the stream; decode with retrieve() on the frames we keep
+        while cap.grab():
+            if frame_count % frame_interval == 0:
+                ret, frame = cap.retrieve()
+                if ret:
+                    output_path = os.path.join(output_dir, f"frame_{saved_count:06d}.png")
+                    # Decoding outpaces encoding, so bound the frames held in memory
+                    if len(writes) >= 2 * max_workers:
+                        writes.popleft().result()
+                    # Copy since the capture may reuse the frame buffer
+                    writes.append(pool.submit(_write_frame, output_path, frame.copy(), write_params))
+                saved_count += 1
+            frame_count += 1
+
+        for write in writes:
+            write.result()
     
     cap.release()
 
+def _write_frame(output_path, frame, write_params):
+    if not cv2.imwrite(output_path, frame, write_params):
+        raise IOError(f"Failed to write frame to {output_path}")
+
 # Usage
 extract_frames("/home/haowei/Documents/TeraSim/CrashCase_HD_Video_rendered/crash_2023298086/final_bev.mp4", 
                 "/home/haowei/Documents/TeraSim/CrashCase_HD_Video_rendered/crash_2023298086/frames", 0.1)
\ No newline at end of file